@@ -1,13 +1,27 @@
-from flask import Flask, render_template, send_from_directory, request, send_file, jsonify, make_response
-from datetime import datetime, timedelta, date
-from icalendar import Calendar, Event
+from flask import Flask, Response, render_template, send_from_directory, request, jsonify, make_response
+from datetime import datetime, timedelta, timezone, date, time as dtime
 import fitz  # PyMuPDF
 import re
+from bisect import bisect_left
 import io
 import os
-from collections import defaultdict
+import threading
+import time
+import uuid
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import blake2b
 from typing import Optional
 
+try:
+    import pypdfium2 as pdfium  # optioneel: alternatieve PDF-backend (zie PDF_BACKEND)
+except ImportError:
+    pdfium = None
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
 # =========================
@@ -43,11 +57,41 @@ def service_worker():
 # PDF → TEXT
 # =========================
 
-def extract_text_from_pdf(file_storage) -> str:
-    data = file_storage.read()
+# Alleen platte tekst nodig: expliciet zonder image-blokken
+_PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# "pymupdf" (standaard) of "pdfium" (vereist pypdfium2; valt anders terug op PyMuPDF)
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "pymupdf").strip().lower()
+
+def _extract_text_pdfium(data: bytes) -> str:
+    pdf = pdfium.PdfDocument(data)
+    try:
+        buf = io.StringIO()
+        for i, page in enumerate(pdf):
+            if i:
+                buf.write("\n")
+            textpage = page.get_textpage()
+            buf.write(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return buf.getvalue()
+    finally:
+        pdf.close()
+
+def extract_text_from_pdf(data: bytes) -> str:
+    if PDF_BACKEND == "pdfium" and pdfium is not None:
+        return _extract_text_pdfium(data)
+
+    # Schrijf elke pagina direct in één buffer i.p.v. eerst een lijst van alle pagina's.
+    # Bewust serieel: PyMuPDF is niet thread-safe en houdt de GIL vast tijdens get_text,
+    # dus een threadpool over pagina's levert geen winst op (alleen risico).
+    buf = io.StringIO()
     with fitz.open(stream=data, filetype="pdf") as doc:
-        parts = [page.get_text() for page in doc]
-    return "\n".join(parts)
+        for i, page in enumerate(doc):
+            if i:
+                buf.write("\n")
+            buf.write(page.get_text("text", flags=_PDF_TEXT_FLAGS, sort=False))
+    return buf.getvalue()
 
 
 # =========================
@@ -58,55 +102,134 @@ def extract_text_from_pdf(file_storage) -> str:
 DATE_RE = r"(\d{2}[/-]\d{2}[/-](?:\d{2}|\d{4}))"
 # streepje in tijden kan '-', en-dash '–' of em-dash '—' zijn
 DASH = r"[-–—]"
+SERVICE = r"(CONSIG|\[?\s*Rust\s*\]?|[A-Za-zÀ-ÖØ-öø-ÿ\s]{0,20}DIENST[A-Za-zÀ-ÖØ-öø-ÿ\s]{0,10})"
+
+# Patronen één keer compileren bij het laden van de module, niet per upload.
+# Datum en dienst zitten in één alternation: de parser loopt de tekst één keer door
+# en dispatcht op m.lastgroup ('date' / 'svc').
+# Possessief ({0,80}+, \s*+) waar teruglopen nooit een andere match oplevert: het
+# cijfervrije tussenstuk en de witruimte rond het streepje. Zo kost een bijna-match
+# (label zonder tijden) geen backtracking meer. Vereist Python 3.11+.
+# Woordgrens vóór het label zoals bij een los gescand datumblok: direct na een datum
+# telt het blok als begin (dus alleen een woordteken mag volgen), niet het laatste
+# cijfer van de datum. Of daar echt een datummatch eindigde kan een lookbehind niet
+# zien: een datumvormige cijferreeks die een eerdere datum overlapt ('09-10-09-25')
+# is geen blokbegin. _BLOCK_START levert daarom kandidaten (reeksen voorafgegaan door
+# een cijfer of '/'/'-' in beide varianten) en de parser beslist met _GLUED_RE tegen
+# het werkelijke blokbegin. Omgekeerd mag (het eind van) de eindtijd niet het begin
+# van de volgende datum zijn ('15:31-02-25', '16:001-05-25'): dan eindigt het blok
+# daar al.
+_BLOCK_START = (
+    r"(?:(?<=\d\d[/-]\d\d[/-]\d\d)(?=\w)"
+    r"|(?<=[\d/-]\d\d[/-]\d\d[/-]\d\d)\b"
+    r"|(?<!\d\d[/-]\d\d[/-]\d\d)\b)"
+)
+_MASTER_PATTERN = (
+    rf"(?P<date>{DATE_RE})"
+    rf"|(?P<svc>{_BLOCK_START}(?P<label>{SERVICE})\b[^0-9]{{0,80}}+"
+    rf"(?P<start>\d{{2}}:\d{{2}})\s*+{DASH}\s*+(?P<end>\d{{2}}:\d{{2}})(?!\d?[/-]\d\d[/-]\d\d))"
+)
+_MASTER_RE = re.compile(_MASTER_PATTERN, re.IGNORECASE | re.DOTALL)
+# cijfer direct gevolgd door een woordteken: géén woordgrens, alleen geldig als blokbegin
+_GLUED_RE = re.compile(r"\d\w")
+# Zelfde patroon zonder IGNORECASE, voor al naar hoofdletters omgezette ASCII-tekst
+# (daar is upper() lengte-behoudend, dus offsets blijven gelijk). Scheelt ~1/3 scantijd.
+_MASTER_UPPER_RE = re.compile(_MASTER_PATTERN.replace("Rust", "RUST"), re.DOTALL)
+_RUST_RE = re.compile(r"(?i)rust")
+_YEAR_RE = re.compile(r"\b(20\d{2})\b")
+_WS_RE = re.compile(r"\s+")
+_MEMO_RE = re.compile(r"(?i)Memo:\s*Activiteit\s*:\s*(.+)")
+_UITVOEREN_RE = re.compile(r"(?i)^Uitvoeren\s+")
+
+_ONE_DAY = timedelta(days=1)
+_MIDNIGHT = dtime(0, 0)
+_ALL_DAY_ENDS = (dtime(23, 59), dtime(0, 0))
+
+# Servicetype-labels; dict-volgorde = prioriteit (CONSIG wint van DIENST wint van RUST)
+_TITLE_RE = re.compile(r"CONSIG|DIENST|RUST", re.IGNORECASE)
+_TITLE_MAP = {"CONSIG": "Consig", "DIENST": "Dienst", "RUST": "Rust"}
+
+_KNOWN_ACTIVITIES = (
+    "wijkzorg", "achterwacht", "surveilleren", "operationeel coördineren",
+    "operationeel coordinator", "toezicht houden", "trainen",
+    "werkverdelen", "monitoren", "evenementen", "afhandelen meldingen",
+    "consig"
+)
+
+# Volgorde = prioriteit: het eerste patroon dat ergens matcht wint
+_VERB_PATTERNS = (
+    r"\buitvoeren\s+wijkzorg\b",
+    r"\bsurveilleren\b",
+    r"\bwerkverdelen(?:\s+en\s+monitoren)?\b",
+    r"\bmonitoren\b",
+    r"\boperationeel\s+co[oö]rdineren\b",
+    r"\btoezicht\s+houden\b",
+    r"\btrainen\b",
+    r"\bevenementen\b",
+    r"\bachterwacht\b",
+    r"\bafhandelen\s+meldingen\b",
+    r"\bwijkzorg\b",
+)
+# Eén alternation i.p.v. een search per patroon; groepnummer = prioriteit
+_VERBS_RE = re.compile("|".join(f"({p})" for p in _VERB_PATTERNS), re.IGNORECASE)
+
+_NORM_TABLE = str.maketrans({"\u00A0": " ", "\u2013": "-", "\u2014": "-"})
 
 def _normalize_text(s: str) -> str:
-    s = (
-        s.replace("\u00A0", " ")
-         .replace("\u2013", "-")
-         .replace("\u2014", "-")
-    )
-    return s.replace("\r\n", "\n").replace("\r", "\n")
+    # Eén pass voor de losse tekens; regeleinden alleen als er een '\r' in zit
+    s = s.translate(_NORM_TABLE)
+    if "\r" in s:
+        s = s.replace("\r\n", "\n").replace("\r", "\n")
+    return s
 
 def _detect_document_year(text: str) -> Optional[int]:
     """
     Zoekt een logisch documentjaar (bv. in 'Periode ... 2025', 'Afgedrukt op 09/09/2025', etc.).
     Neemt de grootste 20xx die voorkomt.
     """
-    years = [int(y) for y in re.findall(r"\b(20\d{2})\b", text)]
+    years = [int(y) for y in _YEAR_RE.findall(text)]
     return max(years) if years else None
 
+@lru_cache(maxsize=4096)
 def _parse_flexible_date(date_str: str, default_year: Optional[int] = None):
     """
     Parseert dd-mm-yyyy / dd/mm/yyyy en dd-mm-yy / dd/mm/yy.
     - Bij 2-cijferig jaar en default_year meegegeven: forceer jaar -> default_year.
+    - Vaste posities (dd?mm?yy[yy]) → direct slicen en date() bouwen, geen strptime;
+      gecachet omdat een rooster dezelfde datums vaak herhaalt.
     """
-    # Eerst: 4-cijferige jaren
-    for fmt in ("%d-%m-%Y", "%d/%m/%Y"):
-        try:
-            return datetime.strptime(date_str, fmt).date()
-        except ValueError:
-            pass
-
-    # Dan: 2-cijferige jaren
-    for fmt in ("%d-%m-%y", "%d/%m/%y"):
-        try:
-            d = datetime.strptime(date_str, fmt).date()
-            if default_year is not None:
-                return d.replace(year=default_year)
-            return d
-        except ValueError:
-            pass
-
-    return None
+    n = len(date_str)
+    if n not in (8, 10):
+        return None
+    sep = date_str[2]
+    if sep not in "-/" or date_str[5] != sep:
+        return None
+
+    try:
+        day, month, year = int(date_str[:2]), int(date_str[3:5]), int(date_str[6:])
+        if n == 10:
+            return date(year, month, day)
+        # zelfde eeuw-pivot als strptime's %y: 00-68 → 20xx, 69-99 → 19xx
+        d = date(year + (2000 if year <= 68 else 1900), month, day)
+        if default_year is not None:
+            return d.replace(year=default_year)
+        return d
+    except ValueError:
+        return None
 
 def _fix_2400(t: str) -> str:
     return "23:59" if t == "24:00" else t
 
+def _hm(t: str):
+    """'HH:MM' → (uur, minuut) via slicing; tijden uit de parser hebben altijd dit formaat."""
+    return int(t[:2]), int(t[3:5])
+
 def _clean_text_short(s: str, limit: int = 80) -> str:
     s = s.strip(" :/.-–—\t\n\r")
-    s = re.sub(r"\s+", " ", s)
+    s = _WS_RE.sub(" ", s)
     return s[:limit]
 
+@lru_cache(maxsize=4096)
 def _service_title(service_raw: str) -> str:
     """
     Net label voor servicetype:
@@ -115,57 +238,39 @@ def _service_title(service_raw: str) -> str:
       - '[Rust]' → 'Rust'
       - anders Title Case
     """
-    t = _clean_text_short(service_raw)
-    up = t.upper()
-    if "CONSIG" in up:
-        return "Consig"
-    if "DIENST" in up:
-        return "Dienst"
-    if "RUST" in up:
-        return "Rust"
-    return t.title()
+    found = {m.group(0).upper() for m in _TITLE_RE.finditer(service_raw)}
+    for key, title in _TITLE_MAP.items():
+        if key in found:
+            return title
+    return _clean_text_short(service_raw).title()
 
+@lru_cache(maxsize=4096)
 def _activity_tag_from_text(text: str) -> str:
     """
     Haal een korte activiteit uit omliggende tekst (bv. 'Wijkzorg', 'Achterwacht', ...).
     Let op 'Memo: Activiteit: ...' en een set werkwoord/keyword-patronen.
     """
     # 1) Memo: Activiteit: <...>
-    m = re.search(r"(?i)Memo:\s*Activiteit\s*:\s*(.+)", text)
+    m = _MEMO_RE.search(text)
     if m:
         val = _clean_text_short(m.group(1).lower())
-        known = [
-            "wijkzorg", "achterwacht", "surveilleren", "operationeel coördineren",
-            "operationeel coordinator", "toezicht houden", "trainen",
-            "werkverdelen", "monitoren", "evenementen", "afhandelen meldingen",
-            "consig"
-        ]
-        for k in known:
+        for k in _KNOWN_ACTIVITIES:
             if k in val:
                 return "Consig" if k == "consig" else k.title()
         return " ".join(val.split()[:3]).title()
 
-    # 2) Losse keywords/werkwoorden
-    verbs = [
-        r"(?i)\buitvoeren\s+wijkzorg\b",
-        r"(?i)\bsurveilleren\b",
-        r"(?i)\bwerkverdelen(?:\s+en\s+monitoren)?\b",
-        r"(?i)\bmonitoren\b",
-        r"(?i)\boperationeel\s+co[oö]rdineren\b",
-        r"(?i)\btoezicht\s+houden\b",
-        r"(?i)\btrainen\b",
-        r"(?i)\bevenementen\b",
-        r"(?i)\bachterwacht\b",
-        r"(?i)\bafhandelen\s+meldingen\b",
-        r"(?i)\bwijkzorg\b",
-    ]
-    for rx in verbs:
-        m2 = re.search(rx, text)
-        if m2:
-            ph = m2.group(0)
-            ph = _clean_text_short(ph.title())
-            ph = re.sub(r"(?i)^Uitvoeren\s+", "", ph).strip()
-            return ph
+    # 2) Losse keywords/werkwoorden: één scan, laagste groepnummer wint
+    best = None
+    for m2 in _VERBS_RE.finditer(text):
+        if best is None or m2.lastindex < best.lastindex:
+            best = m2
+            if best.lastindex == 1:
+                break
+    if best:
+        ph = best.group(0)
+        ph = _clean_text_short(ph.title())
+        ph = _UITVOEREN_RE.sub("", ph).strip()
+        return ph
     return ""
 
 
@@ -173,6 +278,17 @@ def _activity_tag_from_text(text: str) -> str:
 # PARSER (alle diensten + type + activiteit)
 # =========================
 
+@dataclass(slots=True)
+class ShiftEvent:
+    """Eén dienst; niet frozen omdat post-processing CONSIG-blokken verlengt."""
+    summary: str
+    type: str           # origin type ('Consig' / 'Dienst' / …) voor post-processing
+    activity: str
+    start: datetime
+    end: datetime
+    description: str
+
+
 def extract_events_from_text(raw_text: str):
     """
     - Neemt ALLE diensten per dag mee
@@ -184,69 +300,76 @@ def extract_events_from_text(raw_text: str):
     text = _normalize_text(raw_text)
     events = []
 
-    # detecteer documentjaar voor 2-cijferige datums
-    doc_year = _detect_document_year(text)
-
-    date_iter = list(re.finditer(DATE_RE, text))
-    if not date_iter:
+    # Snelle C-level voorcontrole (str.find) vóór de regex-scan: zonder CONSIG/DIENST
+    # kan er geen dienst matchen. 'İ' matcht (?i)I maar wordt door upper() niet 'I'.
+    upper = text.upper()
+    if "CONSIG" not in upper and "DIENST" not in upper and "\u0130" not in text:
         return events
 
-    SERVICE = r"(CONSIG|\[?\s*Rust\s*\]?|[A-Za-zÀ-ÖØ-öø-ÿ\s]{0,20}DIENST[A-Za-zÀ-ÖØ-öø-ÿ\s]{0,10})"
-    service_re = re.compile(
-        rf"(?i)\b{SERVICE}\b[^0-9]{{0,80}}(\d{{2}}:\d{{2}})\s*{DASH}\s*(\d{{2}}:\d{{2}})",
-        re.DOTALL
-    )
-
-    for i, dm in enumerate(date_iter):
-        date_str = dm.group(1)
-        d = _parse_flexible_date(date_str, default_year=doc_year)
-        if d is None:
-            continue
-
-        start_idx = dm.end()
-        end_idx = date_iter[i + 1].start() if i + 1 < len(date_iter) else len(text)
-        chunk = text[start_idx:end_idx]
-        lines = [ln.strip() for ln in chunk.split("\n")]
-
-        def find_activity_near(pos_start: int, pos_end: int) -> str:
-            ctx_before = chunk[max(0, pos_start - 500):pos_start]
-            ctx_after  = chunk[pos_end: min(len(chunk), pos_end + 500)]
-            tag = _activity_tag_from_text(ctx_after)
-            if tag:
-                return tag
-            tag = _activity_tag_from_text(ctx_before)
-            if tag:
-                return tag
-            line_start = chunk[:pos_start].count("\n")
-            for j in range(line_start, min(line_start + 8, len(lines))):
-                t = _activity_tag_from_text(lines[j])
-                if t:
-                    return t
-            return ""
+    # detecteer documentjaar voor 2-cijferige datums
+    doc_year = _detect_document_year(text)
 
+    start_idx = end_idx = 0
+    newlines = None  # posities van alle '\n', pas opgebouwd als de regel-fallback nodig is
+
+    def find_activity_near(pos_start: int, pos_end: int, line_pos: int) -> str:
+        nonlocal newlines
+        # Absolute offsets in text, begrensd tot het huidige datumblok (geen kopie per blok)
+        ctx_before = text[max(start_idx, pos_start - 500):pos_start]
+        ctx_after  = text[pos_end: min(end_idx, pos_end + 500)]
+        tag = _activity_tag_from_text(ctx_after)
+        if tag:
+            return tag
+        tag = _activity_tag_from_text(ctx_before)
+        if tag:
+            return tag
+
+        # Fallback: de regel van het label en max. 7 regels erna (binnen het blok)
+        if newlines is None:
+            newlines = []
+            j = text.find("\n")
+            while j != -1:
+                newlines.append(j)
+                j = text.find("\n", j + 1)
+        k = bisect_left(newlines, line_pos)
+        ls = max(start_idx, newlines[k - 1] + 1) if k else start_idx
+        for _ in range(8):
+            le = newlines[k] if k < len(newlines) and newlines[k] < end_idx else end_idx
+            t = _activity_tag_from_text(text[ls:le].strip())
+            if t:
+                return t
+            if le >= end_idx:
+                break
+            ls, k = le + 1, k + 1
+        return ""
+
+    def flush_block(d, matches):
         seen = set()
-        for m in service_re.finditer(chunk):
-            service_raw = m.group(1)
-            if re.search(r"(?i)rust", service_raw):
+        for m in matches:
+            service_raw = text[m.start("label"):m.end("label")]  # origineel, niet de upper-versie
+            if _RUST_RE.search(service_raw):
                 continue  # sla 'Rust' over
 
-            start_s, end_s = _fix_2400(m.group(2)), _fix_2400(m.group(3))
+            start_s, end_s = _fix_2400(m.group("start")), _fix_2400(m.group("end"))
             try:
-                sdt = datetime.combine(d, datetime.strptime(start_s, "%H:%M").time())
-                edt = datetime.combine(d, datetime.strptime(end_s,   "%H:%M").time())
+                sdt = datetime(d.year, d.month, d.day, *_hm(start_s))
+                edt = datetime(d.year, d.month, d.day, *_hm(end_s))
             except ValueError:
                 continue
 
             if edt <= sdt:
-                edt += timedelta(days=1)
+                edt += _ONE_DAY
 
-            key = (sdt.isoformat(), edt.isoformat(), service_raw.upper())
+            key = (sdt, edt, service_raw.upper())
             if key in seen:
                 continue
             seen.add(key)
 
             service_kind = _service_title(service_raw)   # 'Consig' / 'Dienst' / …
-            activity_tag = find_activity_near(m.start(), m.end())  # bv. 'Wijkzorg'
+            # regel-fallback vanaf het eerste niet-witruimteteken van het label, niet
+            # vanaf witruimte/'\n' van de vorige regel die het label kan meenemen
+            label_pos = m.end("label") - len(service_raw.lstrip())
+            activity_tag = find_activity_near(m.start(), m.end(), label_pos)  # bv. 'Wijkzorg'
 
             # SUMMARY: CONSIG domineert; anders activiteit; anders Dienst
             if service_kind.lower() == "consig":
@@ -263,14 +386,48 @@ def extract_events_from_text(raw_text: str):
             desc_parts.append(f"Tijd: {start_s} - {end_s}")
             description = "\n".join(desc_parts)
 
-            events.append({
-                "summary": summary,
-                "type": service_kind,       # bewaar origin type voor post-processing
-                "activity": activity_tag,
-                "start": sdt,
-                "end": edt,
-                "description": description,
-            })
+            events.append(ShiftEvent(
+                summary=summary,
+                type=service_kind,
+                activity=activity_tag,
+                start=sdt,
+                end=edt,
+                description=description,
+            ))
+
+    # Eén pass: een datum opent een nieuw blok; diensten worden per blok verzameld
+    # en verwerkt zodra het einde van het blok (volgende datum of einde tekst) bekend is.
+    d = None
+    pending = []
+    # Hoofdletters één keer i.p.v. case-insensitive matchen; alleen bij ASCII, want
+    # daarbuiten verandert upper() soms de lengte (ß → SS) of valt buiten de tekenklassen.
+    if text.isascii():
+        scan_re, scan_text = _MASTER_UPPER_RE, upper
+    else:
+        scan_re, scan_text = _MASTER_RE, text
+    pos = 0
+    while pos is not None:
+        scan, pos = scan_re.finditer(scan_text, pos), None
+        for m in scan:
+            if m.lastgroup == "date":
+                if pending:
+                    end_idx = m.start()
+                    flush_block(d, pending)
+                    pending = []
+                d = _parse_flexible_date(m.group("date"), default_year=doc_year)
+                start_idx = m.end()
+                continue
+            i = m.start()
+            if i and (i == start_idx) != bool(_GLUED_RE.match(scan_text, i - 1)):
+                # blokbegin vereist een woordteken, elders een echte woordgrens;
+                # anders geen dienst hier: verder zoeken vanaf het volgende teken
+                pos = i + 1
+                break
+            if d is not None:
+                pending.append(m)
+    if pending:
+        end_idx = len(text)
+        flush_block(d, pending)
 
     return events
 
@@ -284,57 +441,57 @@ def post_process_events(events: list) -> list:
         return events
 
     # 1) Sorteer
-    events.sort(key=lambda e: (e["start"], e["end"], e["summary"]))
-
-    # 2) Merge aaneengesloten CONSIG-blokken (end == next.start)
-    merged = []
-    for ev in events:
-        if ev["type"].lower() != "consig":
-            merged.append(ev)
-            continue
-
-        if merged and merged[-1]["type"].lower() == "consig" and merged[-1]["end"] == ev["start"]:
-            # Plak aan vorige CONSIG vast
-            merged[-1]["end"] = ev["end"]
-            # Update beschrijving als doorlopende periode
-            start_dt = merged[-1]["start"]
-            end_dt = merged[-1]["end"]
-            merged[-1]["description"] = (
-                f"Type: Consig\n"
-                f"Periode: {start_dt.strftime('%d-%m-%Y %H:%M')} → {end_dt.strftime('%d-%m-%Y %H:%M')}"
-            )
-        else:
-            # Maak CONSIG-beschrijving als periode (helder bij dagoverschrijding)
-            ev["description"] = (
-                f"Type: Consig\n"
-                f"Periode: {ev['start'].strftime('%d-%m-%Y %H:%M')} → {ev['end'].strftime('%d-%m-%Y %H:%M')}"
-            )
-            merged.append(ev)
+    events.sort(key=lambda e: (e.start, e.end, e.summary))
 
-    # 3) Verwijder ‘volledige dag’-artefacten (00:00–23:59) als er die dag andere events zijn
     cleaned = []
-    by_day = defaultdict(list)
-    for ev in merged:
-        by_day[ev["start"].date()].append(ev)
+    day_events = []
 
-    for day, day_events in by_day.items():
+    def flush_day():
+        # Verwijder ‘volledige dag’-artefacten (00:00–23:59) als er die dag andere events zijn
         all_day = [
             e for e in day_events
-            if e["start"].time() == datetime.strptime("00:00", "%H:%M").time()
-            and e["end"].time() in (
-                datetime.strptime("23:59", "%H:%M").time(),
-                datetime.strptime("00:00", "%H:%M").time()
-            )
-            and e["type"].lower() == "dienst"
+            if e.start.time() == _MIDNIGHT
+            and e.end.time() in _ALL_DAY_ENDS
+            and e.type.lower() == "dienst"
         ]
         if all_day and len(day_events) > len(all_day):
-            keep = [e for e in day_events if e not in all_day]
+            # op identiteit: `e not in all_day` vergelijkt veld voor veld (dataclass-__eq__), lineair per event
+            all_day_ids = {id(e) for e in all_day}
+            keep = [e for e in day_events if id(e) not in all_day_ids]
         else:
             keep = day_events
+        # sorteren per dag is gelijk aan één eindsortering (dagen komen op volgorde)
+        keep.sort(key=lambda e: (e.start, e.end, e.summary))
         cleaned.extend(keep)
 
-    # 4) Final sort
-    cleaned.sort(key=lambda e: (e["start"], e["end"], e["summary"]))
+    # 2) Eén pass: merge aaneengesloten CONSIG-blokken (end == next.start) en schoon
+    #    per dag op. Een dag wordt pas afgerond als er een event van een latere dag
+    #    bijkomt: tot dan kan een CONSIG van die dag nog verlengd worden.
+    prev = None  # laatst toegevoegde event = enige merge-kandidaat
+    for ev in events:
+        if ev.type.lower() == "consig":
+            if prev is not None and prev.type.lower() == "consig" and prev.end == ev.start:
+                # Plak aan vorige CONSIG vast
+                prev.end = ev.end
+                # Update beschrijving als doorlopende periode
+                prev.description = (
+                    f"Type: Consig\n"
+                    f"Periode: {prev.start.strftime('%d-%m-%Y %H:%M')} → {prev.end.strftime('%d-%m-%Y %H:%M')}"
+                )
+                continue
+            # Maak CONSIG-beschrijving als periode (helder bij dagoverschrijding)
+            ev.description = (
+                f"Type: Consig\n"
+                f"Periode: {ev.start.strftime('%d-%m-%Y %H:%M')} → {ev.end.strftime('%d-%m-%Y %H:%M')}"
+            )
+
+        if day_events and ev.start.date() != day_events[0].start.date():
+            flush_day()
+            day_events = []
+        day_events.append(ev)
+        prev = ev
+
+    flush_day()
     return cleaned
 
 
@@ -342,53 +499,239 @@ def post_process_events(events: list) -> list:
 # ICS GENERATOR
 # =========================
 
-def create_ics(events):
-    cal = Calendar()
-    cal.add("prodid", "-//Rooster Webtool//NL")
-    cal.add("version", "2.0")
+# TEXT-escaping volgens RFC 5545, in één translate-pass
+_ICS_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", ";": "\\;", ",": "\\,", "\n": "\\n", "\r": "\\n"})
+
+def _ics_escape(s: str) -> str:
+    if "\r" in s:
+        s = s.replace("\r\n", "\n")
+    return s.translate(_ICS_ESCAPE_TABLE)
 
+def _ics_line(name: str, value: str) -> str:
+    """
+    Eén content line, gevouwen op 75 octets (RFC 5545 §3.1).
+    Splitst nooit midden in een UTF-8-teken of direct na een escape-backslash.
+    """
+    line = f"{name}:{value}"
+    if len(line.encode("utf-8")) < 75:
+        return line
+
+    parts, cur, n = [], [], 0
+    for ch in line:
+        size = len(ch.encode("utf-8"))
+        if cur and n + size >= 75:
+            # oneven aantal backslashes aan het eind = de laatste begint een escape
+            k = 0
+            while k < len(cur) and cur[-1 - k] == "\\":
+                k += 1
+            carry = cur.pop() if k % 2 and len(cur) > 1 else None
+            parts.append("".join(cur))
+            cur, n = ([carry], 1) if carry else ([], 0)
+        cur.append(ch)
+        n += size
+    parts.append("".join(cur))
+    return "\r\n ".join(parts)
+
+def iter_ics(events):
+    """
+    Genereert de ICS per event als bytes-chunks, zodat de response gestreamd kan
+    worden zonder eerst de hele kalender (en een BytesIO-kopie) in geheugen te bouwen.
+    """
+    yield b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Rooster Webtool//NL\r\n"
+
+    # DTSTAMP = moment van genereren; één keer bepalen voor de hele kalender
+    dtstamp = f"DTSTAMP:{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
     for ev in events:
-        ical_ev = Event()
-        ical_ev.add("summary", ev["summary"])
-        if ev.get("description"):
-            ical_ev.add("description", ev["description"])
-        ical_ev.add("dtstart", ev["start"])
-        ical_ev.add("dtend", ev["end"])
-        ical_ev.add("dtstamp", datetime.utcnow())
-        cal.add_component(ical_ev)
+        lines = [
+            "BEGIN:VEVENT",
+            _ics_line("SUMMARY", _ics_escape(ev.summary)),
+            f"DTSTART:{ev.start:%Y%m%dT%H%M%S}",
+            f"DTEND:{ev.end:%Y%m%dT%H%M%S}",
+            dtstamp,
+        ]
+        if ev.description:
+            lines.append(_ics_line("DESCRIPTION", _ics_escape(ev.description)))
+        lines.append("END:VEVENT\r\n")
+        yield "\r\n".join(lines).encode("utf-8")
 
-    return cal.to_ical()
+    yield b"END:VCALENDAR\r\n"
+
+def create_ics(events) -> bytes:
+    return b"".join(iter_ics(events))
+
+
+# =========================
+# VERWERKING (buiten de request-thread)
+# =========================
+
+def process_pdf(data: bytes) -> list:
+    """Volledige pipeline PDF-bytes → opgeschoonde events; draait in een worker-proces."""
+    raw_text = extract_text_from_pdf(data)
+    raw_events = extract_events_from_text(raw_text)
+    events = post_process_events(raw_events)
+    print(f"[DEBUG] Tekst: {len(raw_text)} chars | ruwe: {len(raw_events)} | na opschonen: {len(events)}")
+    return events
+
+# Aantal worker-processen; standaard één per CPU. 'spawn' i.p.v. fork: de Flask-server
+# draait threaded en PyMuPDF-state hoort niet mee te forken.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def _reset_executor(broken: ProcessPoolExecutor):
+    # Een gecrashte worker (OOM, MuPDF-crash) maakt de hele pool permanent onbruikbaar,
+    # een vastgelopen worker blokkeert hem; gooi hem weg zodat het volgende verzoek een
+    # nieuwe krijgt. Alleen als het nog de huidige pool is: een andere thread kan al
+    # een verse hebben aangemaakt.
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        _executor = None
+    # shutdown() stopt geen lopende worker (en vergeet de processen), dus eerst vastleggen
+    procs = list((broken._processes or {}).values())
+    broken.shutdown(wait=False, cancel_futures=True)
+    for proc in procs:
+        proc.terminate()
+
+def _submit(data: bytes):
+    executor = _get_executor()
+    try:
+        return executor, executor.submit(process_pdf, data)
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        executor = _get_executor()
+        return executor, executor.submit(process_pdf, data)
+
+# job_id → (future, cache-key, aangemaakt, pool); afgehaalde jobs worden direct verwijderd,
+# nooit opgehaalde jobs na _JOB_TTL seconden
+_JOB_TTL = 600
+# Een job die na _JOB_TIMEOUT seconden (incl. wachttijd in de pool) nog loopt geldt als
+# vastgelopen (bv. MuPDF-hang); dan wordt de pool vervangen, anders wachten alle
+# volgende uploads er eindeloos achter.
+_JOB_TIMEOUT = 120
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _prune_jobs(now: float):
+    hung = set()
+    with _jobs_lock:
+        for job_id, (future, _, t, executor) in list(_jobs.items()):
+            if now - t > _JOB_TIMEOUT and not future.done():
+                hung.add(executor)
+            if now - t > _JOB_TTL:
+                del _jobs[job_id]
+    for executor in hung:
+        _reset_executor(executor)
 
 
 # =========================
 # UPLOAD ENDPOINT
 # =========================
 
+# Resultaten per PDF (hash van de bytes) bewaren: dezelfde upload opnieuw hoeft
+# niet opnieuw geparsed te worden. Kleine LRU; lock omdat Flask threaded serveert.
+_RESULT_CACHE_SIZE = 64
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+def _cache_get(key: bytes):
+    with _result_cache_lock:
+        events = _result_cache.get(key)
+        if events is not None:
+            _result_cache.move_to_end(key)
+        return events
+
+def _cache_put(key: bytes, events: list):
+    with _result_cache_lock:
+        _result_cache[key] = events
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > _RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+def _ics_response(events: list):
+    if events:
+        print("[DEBUG] Voorbeeld:", events[0].summary, events[0].start, "→", events[0].end)
+
+    if not events:
+        return jsonify(error="Geen diensten gevonden in dit PDF-bestand."), 400
+
+    return Response(
+        iter_ics(events),
+        mimetype="text/calendar",
+        headers={"Content-Disposition": "attachment; filename=rooster.ics"}
+    )
+
 @app.route("/upload", methods=["POST"])
 def upload():
+    """
+    Cache-hit → direct het ICS-bestand (200).
+    Anders → PDF naar de worker-pool en {"job_id": ...} terug (202); ophalen via /result/<job_id>.
+    """
     try:
         f = request.files.get("file")
         if not f:
             return jsonify(error="Geen bestand ontvangen."), 400
 
-        raw_text = extract_text_from_pdf(f)
-        raw_events = extract_events_from_text(raw_text)
-        events = post_process_events(raw_events)
+        data = f.read()
+        key = blake2b(data, digest_size=16).digest()
+        events = _cache_get(key)
+        if events is not None:
+            print(f"[DEBUG] Cache-hit | na opschonen: {len(events)}")
+            return _ics_response(events)
+
+        now = time.monotonic()
+        _prune_jobs(now)
+        job_id = uuid.uuid4().hex
+        executor, future = _submit(data)
+        with _jobs_lock:
+            _jobs[job_id] = (future, key, now, executor)
+        return jsonify(job_id=job_id), 202
 
-        print(f"[DEBUG] Tekst: {len(raw_text)} chars | ruwe: {len(raw_events)} | na opschonen: {len(events)}")
-        if events:
-            print("[DEBUG] Voorbeeld:", events[0]["summary"], events[0]["start"], "→", events[0]["end"])
+    except Exception as e:
+        print(f"[ERROR] {type(e).__name__}: {e}")
+        return jsonify(error=f"Verwerken mislukt ({type(e).__name__})."), 500
 
-        if not events:
-            return jsonify(error="Geen diensten gevonden in dit PDF-bestand."), 400
+@app.route("/result/<job_id>")
+def result(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return jsonify(error="Onbekende of verlopen taak."), 404
+        future, key, created, executor = job
+        timed_out = not future.done()
+        if timed_out and time.monotonic() - created <= _JOB_TIMEOUT:
+            return jsonify(status="bezig"), 202
+        del _jobs[job_id]
+
+    if timed_out:
+        print(f"[ERROR] Taak {job_id} na {_JOB_TIMEOUT}s niet klaar, pool wordt vervangen")
+        _reset_executor(executor)
+        return jsonify(error="Verwerken duurde te lang. Probeer opnieuw."), 504
 
-        ics_data = create_ics(events)
-        return send_file(
-            io.BytesIO(ics_data),
-            as_attachment=True,
-            download_name="rooster.ics",
-            mimetype="text/calendar"
-        )
+    try:
+        events = future.result()
+        _cache_put(key, events)
+        return _ics_response(events)
+
+    except BrokenProcessPool as e:
+        print(f"[ERROR] Worker gecrasht, pool wordt vervangen: {e}")
+        _reset_executor(executor)
+        return jsonify(error="Verwerken mislukt (worker gecrasht). Probeer opnieuw."), 500
+
+    except CancelledError:
+        # stond nog in de wachtrij van een pool die vervangen is
+        return jsonify(error="Verwerken afgebroken. Probeer opnieuw."), 500
 
     except Exception as e:
         print(f"[ERROR] {type(e).__name__}: {e}")
@@ -0,0 +1,131 @@
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+from unittest import mock
+
+import app
+from app import ShiftEvent
+
+
+class StubPool:
+    """Neemt de plaats in van ProcessPoolExecutor: futures worden door de test afgerond."""
+
+    def __init__(self, *args, **kwargs):
+        self.futures = []
+        self.broken = False
+        self.shut_down = False
+        self._processes = None
+
+    def submit(self, fn, *args):
+        if self.broken:
+            raise BrokenProcessPool("stub")
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shut_down = True
+
+
+def _event():
+    return ShiftEvent(
+        summary="Dienst",
+        type="Dienst",
+        activity="",
+        start=datetime(2025, 9, 10, 8),
+        end=datetime(2025, 9, 10, 16),
+        description="Type: Dienst",
+    )
+
+
+class UploadJobTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(app, "ProcessPoolExecutor", StubPool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app._executor = None
+        app._jobs.clear()
+        app._result_cache.clear()
+        self.addCleanup(setattr, app, "_executor", None)
+        self.client = app.app.test_client()
+
+    def upload(self, data=b"%PDF-stub"):
+        return self.client.post("/upload", data={"file": (BytesIO(data), "rooster.pdf")})
+
+    def test_missing_file(self):
+        r = self.client.post("/upload", data={})
+        self.assertEqual(r.status_code, 400)
+
+    def test_job_flow_and_cache_hit(self):
+        r = self.upload()
+        self.assertEqual(r.status_code, 202)
+        job_id = r.get_json()["job_id"]
+
+        r = self.client.get(f"/result/{job_id}")
+        self.assertEqual(r.status_code, 202)
+
+        app._executor.futures[0].set_result([_event()])
+        r = self.client.get(f"/result/{job_id}")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.mimetype, "text/calendar")
+        self.assertIn(b"DTSTART:20250910T080000", r.data)
+
+        # opgehaald = weg
+        self.assertEqual(self.client.get(f"/result/{job_id}").status_code, 404)
+
+        # zelfde bytes nog eens: direct uit de cache, geen nieuwe job
+        r = self.upload()
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(b"DTSTART:20250910T080000", r.data)
+        self.assertEqual(len(app._executor.futures), 1)
+
+    def test_no_events(self):
+        job_id = self.upload().get_json()["job_id"]
+        app._executor.futures[0].set_result([])
+        self.assertEqual(self.client.get(f"/result/{job_id}").status_code, 400)
+
+    def test_unknown_job(self):
+        r = self.client.get("/result/bestaat-niet")
+        self.assertEqual(r.status_code, 404)
+        self.assertIn("error", r.get_json())
+
+    def test_broken_pool_on_result_is_replaced(self):
+        job_id = self.upload().get_json()["job_id"]
+        pool = app._executor
+        pool.futures[0].set_exception(BrokenProcessPool("worker weg"))
+
+        r = self.client.get(f"/result/{job_id}")
+        self.assertEqual(r.status_code, 500)
+        self.assertTrue(pool.shut_down)
+        self.assertIsNone(app._executor)
+
+        # volgende upload krijgt een nieuwe pool
+        self.assertEqual(self.upload(b"%PDF-other").status_code, 202)
+        self.assertIsNot(app._executor, pool)
+
+    def test_broken_pool_on_submit_is_retried(self):
+        pool = app._get_executor()
+        pool.broken = True
+
+        r = self.upload()
+        self.assertEqual(r.status_code, 202)
+        self.assertTrue(pool.shut_down)
+        self.assertIsNot(app._executor, pool)
+        self.assertEqual(len(app._executor.futures), 1)
+
+    def test_hung_job_times_out(self):
+        job_id = self.upload().get_json()["job_id"]
+        pool = app._executor
+        with mock.patch.object(app, "_JOB_TIMEOUT", -1):
+            r = self.client.get(f"/result/{job_id}")
+        self.assertEqual(r.status_code, 504)
+        self.assertTrue(pool.shut_down)
+        self.assertIsNone(app._executor)
+        self.assertEqual(self.client.get(f"/result/{job_id}").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import re
+import unittest
+from datetime import datetime
+
+from app import ShiftEvent, _ics_escape, _ics_line, create_ics
+
+
+def _physical_lines(folded: str):
+    return folded.encode("utf-8").split(b"\r\n")
+
+
+class IcsEscapeTest(unittest.TestCase):
+
+    def test_escapes_text_specials(self):
+        self.assertEqual(_ics_escape("a,b;c\\d"), "a\\,b\\;c\\\\d")
+
+    def test_escapes_newlines(self):
+        self.assertEqual(_ics_escape("Type: Dienst\nDatum: 10-09-2025"), "Type: Dienst\\nDatum: 10-09-2025")
+        self.assertEqual(_ics_escape("a\r\nb\rc"), "a\\nb\\nc")
+
+
+class IcsFoldTest(unittest.TestCase):
+    """Vouwen op 75 octets (RFC 5545 §3.1) zonder tekens of escapes te splitsen."""
+
+    def assertFolded(self, name, value):
+        folded = _ics_line(name, value)
+        lines = _physical_lines(folded)
+        for i, raw in enumerate(lines):
+            self.assertLessEqual(len(raw), 75)
+            if i:
+                self.assertTrue(raw.startswith(b" "))
+            raw.decode("utf-8")  # geen half multibyte-teken aan een vouwgrens
+        self.assertEqual(folded.replace("\r\n ", ""), f"{name}:{value}")
+        return lines
+
+    def test_short_line_not_folded(self):
+        self.assertEqual(_ics_line("SUMMARY", "Wijkzorg"), "SUMMARY:Wijkzorg")
+
+    def test_ascii_fold_position(self):
+        lines = self.assertFolded("DESCRIPTION", "x" * 100)
+        self.assertEqual(len(lines[0]), 74)
+        self.assertEqual(lines[1], b" " + b"x" * 38)
+
+    def test_multibyte_not_split(self):
+        for value in ("é" * 80, "→" * 60, "Coördineren 🎉 " * 10):
+            for pad in range(4):
+                with self.subTest(value=value[:3], pad=pad):
+                    self.assertFolded("DESCRIPTION", "x" * pad + value)
+
+    def test_escape_not_split_at_fold(self):
+        # backslash van een escape precies op de vouwgrens: gaat mee naar de volgende regel
+        for pad in range(55, 70):
+            value = _ics_escape("a" * pad + ",;\\\n" * 5)
+            with self.subTest(pad=pad):
+                for raw in self.assertFolded("DESCRIPTION", value)[:-1]:
+                    trailing = len(raw) - len(raw.rstrip(b"\\"))
+                    self.assertEqual(trailing % 2, 0)
+
+
+class CreateIcsTest(unittest.TestCase):
+
+    def test_event_serialization(self):
+        ev = ShiftEvent(
+            summary="Wijkzorg, dag; 1",
+            type="Dienst",
+            activity="Wijkzorg",
+            start=datetime(2025, 9, 10, 8),
+            end=datetime(2025, 9, 10, 16),
+            description="Type: Dienst\nActiviteit: Wijkzorg",
+        )
+        ics = create_ics([ev]).decode("utf-8")
+        self.assertTrue(ics.startswith("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"))
+        self.assertTrue(ics.endswith("END:VEVENT\r\nEND:VCALENDAR\r\n"))
+        self.assertIn("\r\nSUMMARY:Wijkzorg\\, dag\\; 1\r\n", ics)
+        self.assertIn("\r\nDTSTART:20250910T080000\r\nDTEND:20250910T160000\r\n", ics)
+        self.assertRegex(ics, r"\r\nDTSTAMP:\d{8}T\d{6}Z\r\n")
+        self.assertIn("\r\nDESCRIPTION:Type: Dienst\\nActiviteit: Wijkzorg\r\n", ics)
+
+
+if __name__ == "__main__":
+    unittest.main()
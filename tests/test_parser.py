@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime
+
+from app import extract_events_from_text
+
+
+class DateBlockBoundaryTest(unittest.TestCase):
+    """Een dienst direct na een datum met 2-cijferig jaar hoort bij dat datumblok."""
+
+    def test_label_glued_to_date(self):
+        for text in (
+            "Periode 2025\n10-09-25DIENST 08:00-16:00",
+            "Periode 2025\n10-09-25CONSIG 08:00-16:00",
+            "Periode 2025\n11/09/25Dagdienst 08:00-16:00",
+        ):
+            with self.subTest(text=text):
+                events = extract_events_from_text(text)
+                self.assertEqual(len(events), 1)
+                self.assertEqual(events[0].start.hour, 8)
+
+    def test_activity_fallback_starts_at_service_line(self):
+        filler = ("x" * 90 + "\n") * 6
+        text = "10-09-25\nDIENST 08:00-16:00\n" + filler + "y" * 90 + " wijkzorg"
+        events = extract_events_from_text(text)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].activity, "Wijkzorg")
+
+    def test_end_time_running_into_next_date(self):
+        # '31-02-20' is de volgende datum; de dienst ervoor heeft geen eindtijd
+        self.assertEqual(extract_events_from_text("12-09-20 dienst 07:00-15:31-02-20"), [])
+
+    def test_date_shaped_digits_overlapping_a_date(self):
+        # '10-09-25' overlapt de datum '10-09-10' en is dus geen blokbegin
+        self.assertEqual(extract_events_from_text("10-09-10-09-25DIENST 08:00-16:00"), [])
+        # ... en na zo'n reeks geldt de gewone woordgrens
+        events = extract_events_from_text("09-10-09-25 DIENST 08:00-12:00 DIENST 08:00-12:00")
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].start, datetime(2009, 10, 9, 8))
+
+    def test_date_starting_in_end_time(self):
+        events = extract_events_from_text("DIENST 08:00-16:001-05-00DIENST 08:00-16:00")
+        self.assertEqual([e.start for e in events], [datetime(2000, 5, 1, 8)])
+
+    def test_adjacent_identical_rows_kept(self):
+        # labels verschillen in witruimte ('DIENST ' vs '\nDIENST '): geen duplicaat
+        for text in (
+            "10-09-25\nDIENST 08:00-16:00\nDIENST 08:00-16:00",
+            "10-09-25 DIENST 08:00-16:00 DIENST 08:00-16:00",
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(len(extract_events_from_text(text)), 2)
+
+    def test_spaced_date_unchanged(self):
+        events = extract_events_from_text("Periode 2025\n10-09-25 DIENST 08:00-16:00")
+        self.assertEqual([(e.start, e.end) for e in events],
+                         [(datetime(2025, 9, 10, 8), datetime(2025, 9, 10, 16))])
+
+
+if __name__ == "__main__":
+    unittest.main()